@@ -218,17 +218,27 @@ def merge_maps(mapfile_glob_str, merged_fname):
     map_file_list = glob.glob(mapfile_glob_str)
     if len(map_file_list) > 0:
         map_list = [SMS_MAP(filename=map_file) for map_file in map_file_list]
-
-        total_map = map_list[0]
-        for map in map_list[1:]:
-            total_map += map
-        total_map.writer(merged_fname)
+        total_map = merge_map_list(map_list, merged_fname=merged_fname)
     else:
         print(f'warning: outputs do not exist: {mapfile_glob_str}, abort writing to map')
         return None
 
     return total_map
 
+def merge_map_list(map_list, merged_fname=None):
+    '''
+    Merge a list of SMS_MAP objects into one,
+    the merged map is written to file if {merged_fname} is specified
+    '''
+    total_map = map_list[0]
+    for map in map_list[1:]:
+        total_map += map
+
+    if merged_fname is not None:
+        total_map.writer(merged_fname)
+
+    return total_map
+
 
 class SMS_ARC():
     '''class for manipulating arcs in SMS maps'''
@@ -308,7 +318,7 @@ class SMS_MAP():
             if type(arcs) == np.ndarray:
                 arcs = np.squeeze(arcs).tolist()
             arcs = list(filter(lambda item: item is not None, arcs))
-            if arcs == [] and detached_nodes==[]:
+            if arcs == [] and len(detached_nodes) == 0:
                 self.valid = False
 
             self.arcs = arcs
@@ -18,6 +18,7 @@ from scipy import interpolate
 from scipy.spatial import cKDTree
 from sklearn.neighbors import NearestNeighbors
 import math
+import shapely
 from shapely.geometry import LineString, Point, MultiPoint
 from shapely.ops import polygonize, unary_union, split, snap
 import geopandas as gpd
@@ -625,17 +626,24 @@ def clean_intersections(arcs=None, target_polygons=None, snap_points: np.ndarray
     Clean arcs (LineStringList, a list of Shapely's LineString objects)
     by first intersecting them (by unary_union),
     then snapping target points (within 'target_polygons') to 'snap_points',
+
+    arcs and target_polygons can also be numpy arrays of shapely geometries,
+    for which the union is done by a single vectorized call without building a GeoDataFrame
     '''
 
-    arcs0 = deepcopy(arcs)
-    if isinstance(arcs0, list):
-        arcs_gdf = gpd.GeoDataFrame({'index': range(len(arcs)),'geometry': arcs})
-    elif isinstance(arcs0, gpd.GeoDataFrame):
-        arcs_gdf = arcs0
+    if isinstance(arcs, np.ndarray):
+        arcs = shapely.union_all(arcs).geoms  # shapely geometries are immutable, no need to copy
     else:
-        raise TypeError()
+        arcs0 = deepcopy(arcs)
+        if isinstance(arcs0, list):
+            arcs_gdf = gpd.GeoDataFrame({'index': range(len(arcs)),'geometry': arcs})
+        elif isinstance(arcs0, gpd.GeoDataFrame):
+            arcs_gdf = arcs0
+        else:
+            raise TypeError()
+        arcs = arcs_gdf.geometry.unary_union.geoms
 
-    if isinstance(target_polygons, list):
+    if isinstance(target_polygons, (list, np.ndarray)):
         target_poly_gdf = list2gdf(target_polygons)
     elif isinstance(target_polygons, gpd.GeoDataFrame):
         target_poly_gdf = target_polygons
@@ -644,8 +652,6 @@ def clean_intersections(arcs=None, target_polygons=None, snap_points: np.ndarray
     else:
         raise TypeError()
 
-    arcs = arcs_gdf.geometry.unary_union.geoms
-
     if idummy:
         return [arc for arc in arcs]
 
@@ -960,6 +966,9 @@ def make_river_map(
 
     i_DEM_cache : Whether or not to read DEM info from cache.
                   Reading from original *.tif files can be slow, so the default option is True
+
+    Returns a dict of the main outputs kept in memory (SMS maps and lists of polygons),
+    which are also written to files. The parallel driver merges them without reading the files back.
     '''
 
     # ------------------------- other input parameters not exposed to user ---------------------------
@@ -1294,11 +1303,13 @@ def make_river_map(
     # end enumerating each thalweg
 
     # -----------------------------------diagnostic outputs ----------------------------
+    outputs = {}  # main outputs returned to the caller
     if any(bank_arcs.flatten()) and not i_fake_channel:  # not all arcs are None
         SMS_MAP(arcs=bank_arcs.reshape((-1, 1))).writer(filename=f'{output_dir}/{output_prefix}bank.map')
         SMS_MAP(arcs=bank_arcs_raw.reshape((-1, 1))).writer(filename=f'{output_dir}/{output_prefix}bank_raw.map')
         SMS_MAP(arcs=cc_arcs.reshape((-1, 1))).writer(filename=f'{output_dir}/{output_prefix}cc_arcs.map')
-        SMS_MAP(arcs=river_arcs.reshape((-1, 1))).writer(filename=f'{output_dir}/{output_prefix}river_arcs.map')
+        outputs['river_arcs'] = SMS_MAP(arcs=river_arcs.reshape((-1, 1)))
+        outputs['river_arcs'].writer(filename=f'{output_dir}/{output_prefix}river_arcs.map')
         SMS_MAP(detached_nodes=bombed_points).writer(filename=f'{output_dir}/{output_prefix}relax_points.map')
         SMS_MAP(arcs=smoothed_thalwegs).writer(filename=f'{output_dir}/{output_prefix}smoothed_thalweg.map')
         SMS_MAP(arcs=redistributed_thalwegs).writer(filename=f'{output_dir}/{output_prefix}redist_thalweg.map')
@@ -1347,11 +1358,13 @@ def make_river_map(
 
     # ------------------------- main outputs ---------------------------
     if len(total_arcs_cleaned) > 0:
-        SMS_MAP(arcs=centerlines).writer(filename=f'{output_dir}/{output_prefix}centerlines.map')
+        outputs['centerlines'] = SMS_MAP(arcs=centerlines)
+        outputs['centerlines'].writer(filename=f'{output_dir}/{output_prefix}centerlines.map')
         del centerlines[:]; del centerlines
         SMS_MAP(arcs=final_thalwegs).writer(filename=f'{output_dir}/{output_prefix}final_thalweg.map')
         del final_thalwegs[:]; del final_thalwegs
-        SMS_MAP(arcs=bank_arcs_final.reshape((-1, 1))).writer(filename=f'{output_dir}/{output_prefix}bank_final.map')
+        outputs['bank_final'] = SMS_MAP(arcs=bank_arcs_final.reshape((-1, 1)))
+        outputs['bank_final'].writer(filename=f'{output_dir}/{output_prefix}bank_final.map')
         del bank_arcs_final
 
         if not i_blast_intersection:
@@ -1361,14 +1374,17 @@ def make_river_map(
                 ).to_file(filename=f'{output_dir}/{output_prefix}bomb_polygons.shp', driver="ESRI Shapefile")
             else:
                 print(f'{mpi_print_prefix} Warning: bomb_polygons empty')
+            outputs['bomb_polygons'] = list(bomb_polygons)
             del bomb_polygons[:]; del bomb_polygons
 
         if len(total_arcs_cleaned) > 0:
-            SMS_MAP(arcs=geos2SmsArcList(geoms=total_arcs_cleaned)).writer(filename=f'{output_dir}/{output_prefix}total_arcs.map')
+            outputs['total_arcs'] = SMS_MAP(arcs=geos2SmsArcList(geoms=total_arcs_cleaned))
+            outputs['total_arcs'].writer(filename=f'{output_dir}/{output_prefix}total_arcs.map')
         else:
             print(f'{mpi_print_prefix} Warning: total_sms_arcs_cleaned empty')
 
-        SMS_MAP(detached_nodes=bombed_xyz).writer(f'{output_dir}/{output_prefix}total_intersection_joints.map')
+        outputs['total_intersection_joints'] = SMS_MAP(detached_nodes=bombed_xyz)
+        outputs['total_intersection_joints'].writer(f'{output_dir}/{output_prefix}total_intersection_joints.map')
 
         total_arcs_cleaned_polys = [poly for poly in polygonize(gpd.GeoSeries(total_arcs_cleaned))]
         if len(total_arcs_cleaned_polys) > 0:
@@ -1390,6 +1406,9 @@ def make_river_map(
                 ).to_file(filename=f'{output_dir}/{output_prefix}river_outline.shp', driver="ESRI Shapefile")
             else:
                 print(f'{mpi_print_prefix} Warning: total_river_outline_polys empty')
+            outputs['river_outline'] = list(total_river_outline_polys)
             del total_river_outline_polys
 
         del total_arcs_cleaned[:]; del total_arcs_cleaned
+
+    return outputs
@@ -10,60 +10,323 @@ see sample_parallel.py in the installation directory.
 
 
 import os
+import sys
 import time
+import zipfile
 from mpi4py import MPI
-from glob import glob
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pickle
 import geopandas as gpd
-from shapely.ops import polygonize
+import pyogrio
+import shapely
 from RiverMapper.river_map_tif_preproc import find_thalweg_tile, Tif2XYZ
 from RiverMapper.make_river_map import make_river_map, clean_intersections, geos2SmsArcList, Geoms_XY, clean_arcs
-from RiverMapper.SMS import merge_maps, SMS_MAP
+from RiverMapper.SMS import merge_map_list, SMS_MAP
 from RiverMapper.util import silentremove
 
 
+THALWEG_WEIGHT = 1e6  # cost of processing one thalweg, in equivalent bytes of DEM tiles; see group_weights
+# per-group outputs of make_river_map that are merged by rank 0, and the names of the merged files
+MERGED_MAPS = {
+    'total_arcs': 'total_arcs.map',
+    'total_intersection_joints': 'total_intersection_joints.map',
+    'river_arcs': 'total_river_arcs.map',
+    'centerlines': 'total_centerlines.map',
+    'bank_final': 'total_banks_final.map',
+}
+MERGED_POLYGONS = {
+    'river_outline': 'total_river_outline.shp',
+    'bomb_polygons': 'total_bomb_polygons.shp',
+}
+GROUPING_KEYS = ['thalwegs2tile_groups', 'file_table', 'tile_centers', 'file_data', 'file_offsets', 'thalweg_data', 'thalweg_offsets']
+
+
+def my_mpi_range(N, size, rank):
+    '''
+    Closed-form range [start, end) of the tasks of the current rank
+    when N tasks are distributed evenly to {size} ranks,
+    the first N % size ranks get one extra task (same as np.array_split)
+    '''
+    n_per_rank, remainder = divmod(N, size)
+    start = rank * n_per_rank + min(rank, remainder)
+    end = start + n_per_rank + (1 if rank < remainder else 0)
+    return start, end
+
 def my_mpi_idx(N, size, rank):
     '''
-    Distribute N tasks to {size} ranks.
-    The return value is a bool vector of the shape (N, ),
+    Distribute N tasks to {size} ranks,
+    each rank gets about the same number of tasks.
+    The return values are the task ids of the current rank and
+    a bool vector of the shape (N, ),
     with True indices indicating tasks for the current rank.
     '''
     i_my_groups = np.zeros((N, ), dtype=bool)
-    groups = np.array_split(range(N), size)  # n_per_rank, _ = divmod(N, size)
-    my_group_ids = groups[rank]
+    start, end = my_mpi_range(N, size, rank)
+    my_group_ids = np.arange(start, end)
     i_my_groups[my_group_ids] = True
     return my_group_ids, i_my_groups
 
-def merge_outputs(output_dir):
-    print(f'\n------------------ merging outputs from all cores --------------\n')
-    time_merge_start = time.time()
+def group_weights(file_data, file_offsets, thalweg_offsets, tile_sizes, thalweg_weight=THALWEG_WEIGHT):
+    '''
+    Estimate the cost of each group for load balancing:
+    the total size (in bytes) of the group's DEM tiles plus
+    {thalweg_weight} for each thalweg in the group.
+    Groups are given as the CSR arrays of encode_grouping;
+    {tile_sizes} are the file sizes of the entries of the file table
+    '''
+    n_groups = len(file_offsets) - 1
+    sizes = np.r_[np.asarray(tile_sizes, dtype=float), 0.0]  # index -1 (no DEM found) points to the trailing 0
+    group_of_file = np.repeat(np.arange(n_groups), np.diff(file_offsets))
+    tile_weights = np.bincount(group_of_file, weights=sizes[file_data], minlength=n_groups)
+    return tile_weights + thalweg_weight * np.diff(thalweg_offsets)
 
-    # sms maps
-    total_arcs_map = merge_maps(f'{output_dir}/*_total_arcs.map', merged_fname=f'{output_dir}/total_arcs.map')
+def group_centers(file_data, file_offsets, tile_centers):
+    '''
+    Representative coordinates of each group:
+    the mean of the box centers of its DEM tiles (nan if the group has no DEM tile).
+    Groups are given as the CSR arrays of encode_grouping;
+    {tile_centers} are the box centers of the entries of the file table (see encode_grouping)
+    '''
+    n_groups = len(file_offsets) - 1
+    group_of_file = np.repeat(np.arange(n_groups), np.diff(file_offsets))
+    valid = file_data >= 0
+    counts = np.bincount(group_of_file[valid], minlength=n_groups)
+    centers = np.full((n_groups, 2), np.nan)
+    has_tile = counts > 0
+    for k in range(2):
+        sums = np.bincount(group_of_file[valid], weights=tile_centers[file_data[valid], k], minlength=n_groups)
+        centers[has_tile, k] = sums[has_tile] / counts[has_tile]
+    return centers
+
+def part1by1(v):
+    '''
+    Spread the lower 16 bits of unsigned integers,
+    inserting a zero bit between every two bits
+    '''
+    v = v & np.uint64(0x0000ffff)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00ff00ff)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0f0f0f0f)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+def morton_order(xy):
+    '''
+    Order of points (an (n, 2) array) along a Z-order (Morton) space-filling curve,
+    based on 32-bit codes interleaving 16-bit quantized x and y.
+    Points with nan coordinates are placed at the end.
+    '''
+    codes = np.full((len(xy), ), np.iinfo(np.uint64).max, dtype=np.uint64)
+    valid = np.all(np.isfinite(xy), axis=1)
+    if np.any(valid):
+        xy_min = xy[valid].min(axis=0)
+        xy_span = xy[valid].max(axis=0) - xy_min
+        xy_span[xy_span == 0] = 1.0
+        ij = ((xy[valid] - xy_min) / xy_span * 0xffff).astype(np.uint64)
+        codes[valid] = part1by1(ij[:, 0]) | (part1by1(ij[:, 1]) << np.uint64(1))
+    return np.argsort(codes, kind='stable')
+
+def sfc_partition(weights, order, size):
+    '''
+    Cut tasks ordered along a space-filling curve ({order}) into {size} contiguous segments of similar total weight,
+    so that each rank gets spatially adjacent tasks.
+    Returns a list of {size} arrays of task ids, in the order along the curve.
+    '''
+    w = np.asarray(weights, dtype=float)[order]
+    total = w.sum()
+    if total <= 0:
+        w = np.ones_like(w)
+        total = max(len(w), 1)
+    # each task goes to the segment where the midpoint of its cumulative weight falls
+    owner = np.minimum(((np.cumsum(w) - w / 2) / total * size).astype(int), size - 1)
+    return [order[owner == rank] for rank in range(size)]
+
+def bcast_array(arr, comm, root=0, mpi_type=MPI.INT64_T):
+    '''
+    Broadcast a numpy array from {root} to all ranks.
+    Only the shape and dtype are pickled (tiny);
+    the data are sent with the buffer-based Bcast without serialization.
+    '''
+    rank = comm.Get_rank()
+    if rank == root:
+        arr = np.ascontiguousarray(arr)
+        header = (arr.shape, arr.dtype.str)
+    else:
+        header = None
 
-    total_intersection_joints = merge_maps(f'{output_dir}/*intersection_joints*.map', merged_fname=f'{output_dir}/total_intersection_joints.map').detached_nodes
+    shape, dtype = comm.bcast(header, root=root)
+    if rank != root:
+        arr = np.empty(shape, dtype=dtype)
+    comm.Bcast([arr, mpi_type], root=root)
+    return arr
 
-    total_river_map = merge_maps(f'{output_dir}/*river_arcs.map', merged_fname=f'{output_dir}/total_river_arcs.map')
-    if total_river_map is not None:
-        total_river_arcs = total_river_map.arcs
+def groups2csr(groups):
+    '''
+    Flatten a list of variable-length integer groups into
+    a data array and an offsets array (CSR style),
+    i.e., group i is data[offsets[i]:offsets[i+1]]
+    '''
+    lens = [len(group) for group in groups]
+    offsets = np.cumsum([0] + lens).astype(np.int64)
+    if len(groups) > 0:
+        data = np.concatenate([np.array(group, dtype=np.int64).reshape(-1) for group in groups])
     else:
-        total_river_arcs = None
+        data = np.zeros((0, ), dtype=np.int64)
+    return data, offsets
+
+def csr2groups(data, offsets):
+    '''
+    Inverse of groups2csr.
+    Returns an object array of int arrays, which are views of {data} (no copy).
+    '''
+    n_groups = len(offsets) - 1
+    groups = np.empty((n_groups, ), dtype=object)
+    for i, group in enumerate(np.split(data, offsets[1:-1])[:n_groups]):
+        groups[i] = group
+    return groups
+
+def encode_grouping(thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs, tile_boxes):
+    '''
+    Convert the outputs of find_thalweg_tile into flat numpy arrays:
+    a table of unique DEM tile file names (fixed-width UTF-8 bytes),
+    the box centers of the tiles in the table (from {tile_boxes}, a dict of file name: [ulx, lry, lrx, uly]),
+    and CSR arrays of tile indices (-1 for None, i.e., no DEM found) and thalweg indices for each group.
+    '''
+    file_table = list(dict.fromkeys(file for group in tile_groups_files for file in group if file is not None))
+    file2idx = {file: i for i, file in enumerate(file_table)}
+    file_idx = [[-1 if file is None else file2idx[file] for file in group] for group in tile_groups_files]
+
+    grouping = {'thalwegs2tile_groups': np.array(thalwegs2tile_groups, dtype=np.int64)}
+    grouping['file_table'] = np.array([file.encode('utf-8') for file in file_table]) if len(file_table) > 0 else np.zeros((0, ), dtype='S1')
+    grouping['tile_centers'] = np.array(
+        [[(ulx + lrx) / 2, (lry + uly) / 2] for ulx, lry, lrx, uly in (tile_boxes[file] for file in file_table)], dtype=float
+    ).reshape(-1, 2)
+    grouping['file_data'], grouping['file_offsets'] = groups2csr(file_idx)
+    grouping['thalweg_data'], grouping['thalweg_offsets'] = groups2csr(tile_groups2thalwegs)
+    return grouping
+
+def csr2files(file_data, file_offsets, file_table):
+    '''
+    Convert CSR arrays of tile indices back to an object array of lists of DEM file names,
+    with None for index -1 (no DEM found)
+    '''
+    file_groups = csr2groups(file_data, file_offsets)
+    tile_groups_files = np.empty((len(file_groups), ), dtype=object)
+    for i, group in enumerate(file_groups):
+        tile_groups_files[i] = [None if idx < 0 else file_table[idx] for idx in group]
+    return tile_groups_files
+
+def decode_grouping(grouping):
+    '''
+    Inverse of encode_grouping.
+    Group-wise structures are returned as object arrays to be indexed by a bool mask.
+    '''
+    file_table = [file.decode() for file in grouping['file_table']]
+    tile_groups_files = csr2files(grouping['file_data'], grouping['file_offsets'], file_table)
+    tile_groups2thalwegs = csr2groups(grouping['thalweg_data'], grouping['thalweg_offsets'])
+    return grouping['thalwegs2tile_groups'], tile_groups_files, tile_groups2thalwegs
 
-    total_centerlines = merge_maps(f'{output_dir}/*centerlines.map', merged_fname=f'{output_dir}/total_centerlines.map')
-    merge_maps(f'{output_dir}/*bank_final*.map', merged_fname=f'{output_dir}/total_banks_final.map')
+def scatter_groups(grouping, partitions, comm, root=0):
+    '''
+    Send to each rank only the groups assigned to it ({partitions}[rank], only needed on {root}),
+    using the buffer-based Scatterv on the flat arrays of encode_grouping.
+    Returns the global ids of the current rank's groups and
+    the CSR arrays (data, offsets) of their tile indices and thalweg indices.
+    '''
+    rank = comm.Get_rank()
+    size = comm.Get_size()
 
-    # # shapefiles
-    river_outline_files = glob(f'{output_dir}/*_river_outline.shp')
-    if len(river_outline_files) > 0:
-        gpd.pd.concat([gpd.read_file(x).to_crs('epsg:4326') for x in river_outline_files]).to_file(f'{output_dir}/total_river_outline.shp')
+    sendbufs = [None, None, None]
+    counts = None
+    if rank == root:
+        n_files = np.diff(grouping['file_offsets'])
+        n_thalwegs = np.diff(grouping['thalweg_offsets'])
+        file_groups = csr2groups(grouping['file_data'], grouping['file_offsets'])
+        thalweg_groups = csr2groups(grouping['thalweg_data'], grouping['thalweg_offsets'])
+
+        # groups ordered by destination rank
+        group_ids = np.concatenate([np.zeros((0, ), dtype=np.int64)] + [np.array(x, dtype=np.int64) for x in partitions])
+        sendbufs = [
+            np.c_[group_ids, n_files[group_ids], n_thalwegs[group_ids]].astype(np.int64).reshape(-1),
+            groups2csr(file_groups[group_ids])[0],
+            groups2csr(thalweg_groups[group_ids])[0],
+        ]
+        # number of groups, tile indices and thalweg indices sent to each rank
+        counts = np.array([[len(x), n_files[x].sum(), n_thalwegs[x].sum()] for x in partitions], dtype=np.int64)
+
+    my_counts = np.zeros((3, ), dtype=np.int64)
+    comm.Scatter([counts, MPI.INT64_T] if rank == root else None, [my_counts, MPI.INT64_T], root=root)
+    my_counts[0] *= 3  # each group has 3 entries in the first buffer: id, number of tiles, number of thalwegs
+
+    recvbufs = []
+    for k, sendbuf in enumerate(sendbufs):
+        recvbuf = np.empty((my_counts[k], ), dtype=np.int64)
+        if rank == root:
+            sendcounts = counts[:, k] * 3 if k == 0 else counts[:, k]
+            displs = np.r_[0, np.cumsum(sendcounts)[:-1]]
+            comm.Scatterv([sendbuf, sendcounts, displs, MPI.INT64_T], [recvbuf, MPI.INT64_T], root=root)
+        else:
+            comm.Scatterv(None, [recvbuf, MPI.INT64_T], root=root)
+        recvbufs.append(recvbuf)
+
+    my_meta, my_file_data, my_thalweg_data = recvbufs
+    my_meta = my_meta.reshape(-1, 3)
+    my_file_offsets = np.cumsum(np.r_[0, my_meta[:, 1]]).astype(np.int64)
+    my_thalweg_offsets = np.cumsum(np.r_[0, my_meta[:, 2]]).astype(np.int64)
+    return my_meta[:, 0], (my_file_data, my_file_offsets), (my_thalweg_data, my_thalweg_offsets)
+
+def collect_rank_outputs(group_outputs):
+    '''
+    Combine the in-memory outputs (returned by make_river_map) of all groups handled by the current rank:
+    SMS maps are merged into one map per product and polygons are encoded as WKB,
+    so that each rank sends one compact object to rank 0.
+    '''
+    rank_outputs = {}
+    for key in MERGED_MAPS:
+        maps = [x[key] for x in group_outputs if key in x and x[key].valid]
+        rank_outputs[key] = merge_map_list(maps) if len(maps) > 0 else None
+    for key in MERGED_POLYGONS:
+        polygons = [polygon for x in group_outputs for polygon in x.get(key, [])]
+        rank_outputs[key] = shapely.to_wkb(np.array(polygons, dtype=object))
+    return rank_outputs
+
+def merge_outputs(output_dir, outputs_from_ranks):
+    '''
+    Merge the outputs gathered from all ranks (see collect_rank_outputs) and write the merged files
+    '''
+    print(f'\n------------------ merging outputs from all cores --------------\n')
+    time_merge_start = time.time()
 
-    bomb_polygon_files = glob(f'{output_dir}/*_bomb_polygons.shp')
-    if len(bomb_polygon_files) > 0:
-        gpd.pd.concat([gpd.read_file(x).to_crs('epsg:4326') for x in bomb_polygon_files]).to_file(f'{output_dir}/total_bomb_polygons.shp')
+    # sms maps
+    total_maps = {}
+    for key, merged_fname in MERGED_MAPS.items():
+        maps = [x[key] for x in outputs_from_ranks if x[key] is not None]
+        if len(maps) > 0:
+            total_maps[key] = merge_map_list(maps, merged_fname=f'{output_dir}/{merged_fname}')
+        else:
+            print(f'warning: outputs do not exist: {key}, abort writing to map')
+            total_maps[key] = None
+
+    total_arcs_map = total_maps['total_arcs']
+    total_intersection_joints = total_maps['total_intersection_joints'].detached_nodes
+    if total_maps['river_arcs'] is not None:
+        total_river_arcs = total_maps['river_arcs'].arcs
+    else:
+        total_river_arcs = None
+    total_centerlines = total_maps['centerlines']
+
+    # shapefiles
+    total_polygons = {}
+    for key, merged_fname in MERGED_POLYGONS.items():
+        wkb = np.concatenate([x[key] for x in outputs_from_ranks])
+        if len(wkb) > 0:
+            total_polygons[key] = gpd.GeoDataFrame(geometry=shapely.from_wkb(wkb), crs='epsg:4326')
+            pyogrio.write_dataframe(total_polygons[key], f'{output_dir}/{merged_fname}')
+        else:
+            total_polygons[key] = None
 
     print(f'Merging outputs took: {time.time()-time_merge_start} seconds.')
-    return [total_arcs_map, total_intersection_joints, total_river_arcs, total_centerlines]
+    return [total_arcs_map, total_intersection_joints, total_river_arcs, total_centerlines, total_polygons['bomb_polygons']]
 
 
 def final_clean_up(output_dir, total_arcs_map, snap_points, i_blast_intersection=False, total_river_arcs=None):
@@ -96,7 +359,7 @@ def river_map_mpi_driver(
                     Because banks will be searched within this range,
                     its value is needed now to identify parent DEM tiles of each thalweg
     i_DEM_cache : Whether or not to read DEM info from cache.
-                  Reading from original *.tif files can be a little slower than reading from the *.pkl cache,
+                  Reading from original *.tif files can be a little slower than reading from the memory-mapped *.npy cache,
                   so the default option is True
     '''
 
@@ -105,10 +368,12 @@ def river_map_mpi_driver(
                              # The cache file saves coordinates, index, curvature, and direction at all thalweg points
     # i_grouping_cache: Whether or not to read grouping info from cache,
     #                   which is useful when the same DEMs and thalweg_shp_fname are used.
-    #                   A cache file named "dems_json_file + thalweg_shp_fname_grouping.cache" will be saved regardless of the option value.
+    #                   A cache file named "dems_json_file + thalweg_shp_fname_grouping.npz" will be saved regardless of the option value.
+    #                   The cache holds the flat arrays of encode_grouping, which are also what is broadcast to all ranks.
     #                   This is usually fast even without reading cache.
     i_grouping_cache = True; iValidateCache = False
     cache_folder = './Cache/'
+    n_io_threads = 8  # number of threads per rank for reading DEM tiles when validating the DEM cache
 
     rank = comm.Get_rank()
     size = comm.Get_size()
@@ -117,9 +382,7 @@ def river_map_mpi_driver(
         time_start = time_grouping_start = time.time()
         print('\n---------------------------------grouping thalwegs---------------------------------\n')
 
-    comm.Barrier()
-
-    thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs = None, None, None
+    grouping = None
     if rank == 0:
         print(f'A total of {size} core(s) used.')
         silentremove(output_dir)
@@ -129,31 +392,48 @@ def river_map_mpi_driver(
             os.makedirs(cache_folder, exist_ok=True)
             cache_name = cache_folder + \
                 os.path.basename(dems_json_file) + '_' + \
-                os.path.basename(thalweg_shp_fname) + '_grouping.cache'
+                os.path.basename(thalweg_shp_fname) + '_grouping.npz'
             try:
-                with open(cache_name, 'rb') as file:
+                with np.load(cache_name) as cache:
                     print(f'Reading grouping info from cache ...')
-                    thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs = pickle.load(file)
+                    grouping = {key: cache[key] for key in GROUPING_KEYS}
             except FileNotFoundError:
                 print(f"Grouping cache does not exist at {cache_folder}. Cache will be generated after grouping.")
+            except (zipfile.BadZipFile, KeyError, ValueError, EOFError):
+                print(f"Grouping cache {cache_name} is corrupt or outdated. Cache will be regenerated after grouping.")
 
-        if thalwegs2tile_groups is None:
-            thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs = find_thalweg_tile(
+        if grouping is None:
+            thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs, tile_boxes = find_thalweg_tile(
                 dems_json_file=dems_json_file,
                 thalweg_shp_fname=thalweg_shp_fname,
                 thalweg_buffer = thalweg_buffer,
                 iNoPrint=bool(rank), # only rank 0 prints to screen
-                i_thalweg_cache=i_thalweg_cache
+                i_thalweg_cache=i_thalweg_cache,
+                i_return_boxes=True
             )
+            # the tile boxes already read during grouping are saved with the grouping,
+            # so that rank 0 does not open every tile again to balance the workload
+            grouping = encode_grouping(thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs, tile_boxes)
             if i_grouping_cache:
-                with open(cache_name, 'wb') as file:
-                    pickle.dump([thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs], file)
+                # write to a temporary file and rename it (atomic),
+                # so that an interrupted run never leaves a partially written cache
+                with open(cache_name + '.tmp', 'wb') as file:
+                    np.savez_compressed(file, **grouping)
+                os.replace(cache_name + '.tmp', cache_name)
+    else:
+        grouping = dict.fromkeys(GROUPING_KEYS)
 
-    thalwegs2tile_groups = comm.bcast(thalwegs2tile_groups, root=0)
-    tile_groups_files = comm.bcast(tile_groups_files, root=0)
-    tile_groups2thalwegs = comm.bcast(tile_groups2thalwegs, root=0)
+    # output_dir must be cleared and recreated by rank 0 before any rank writes to it
+    comm.Barrier()
+
+    # All ranks need the table of DEM tiles (for caching and for decoding their groups),
+    # which is broadcast as a flat array instead of pickled python objects;
+    # the groups themselves are scattered to their assigned ranks later
+    grouping['file_table'] = bcast_array(grouping['file_table'], comm, mpi_type=MPI.CHAR)
+    file_table = [file.decode() for file in grouping['file_table']]
 
     if rank == 0:
+        thalwegs2tile_groups, tile_groups_files, tile_groups2thalwegs = decode_grouping(grouping)
         print(f'Thalwegs are divided into {len(tile_groups2thalwegs)} groups.')
         for i, tile_group2thalwegs in enumerate(tile_groups2thalwegs):
             print(f'[ Group {i+1} ]-----------------------------------------------------------------------\n' + \
@@ -161,88 +441,117 @@ def river_map_mpi_driver(
                   f'Group {i+1} needs the following DEMs: {tile_groups_files[i]}\n')
         print(f'Grouping took: {time.time()-time_grouping_start} seconds')
 
-    comm.barrier()
     if rank == 0: print('\n---------------------------------caching DEM tiles---------------------------------\n')
-    comm.barrier()
 
     if i_DEM_cache:
-        unique_tile_files = []
-        for group in tile_groups_files:
-            for file in group:
-                if (file not in unique_tile_files) and (file is not None):
-                    unique_tile_files.append(file)
-        unique_tile_files = np.array(unique_tile_files)
+        # the file table is already free of duplicates and None (see encode_grouping)
+        unique_tile_files = file_table
 
         if iValidateCache:
-            for tif_fname in unique_tile_files[my_mpi_idx(len(unique_tile_files), size, rank)]:
-                _, is_new_cache = Tif2XYZ(tif_fname=tif_fname)
-                if is_new_cache:
-                    print(f'[Rank: {rank} cached DEM {tif_fname}')
-                else:
-                    print(f'[Rank: {rank} validated existing cache for {tif_fname}')
-
-    comm.Barrier()
+            start, end = my_mpi_range(len(unique_tile_files), size, rank)
+            my_tifs = unique_tile_files[start:end]
+            # GDAL releases the GIL during I/O, so threads overlap the reading of different tiles
+            with ThreadPoolExecutor(max_workers=n_io_threads) as executor:
+                for tif_fname, (S, is_new_cache) in zip(my_tifs, executor.map(Tif2XYZ, my_tifs)):
+                    # cheap check that the memory-mapped cache is readable at both ends (only two pages are read)
+                    _ = S.elev[0, 0], S.elev[-1, -1]
+                    if is_new_cache:
+                        print(f'[Rank: {rank} cached DEM {tif_fname}')
+                    else:
+                        print(f'[Rank: {rank} validated existing cache for {tif_fname}')
+
+    # Ranks finishing early can go on to assign groups,
+    # but all DEM caches must be ready before map generation starts
+    dem_cache_request = comm.Ibarrier()
     if rank == 0: print('\n---------------------------------assign groups to each core---------------------------------\n')
-    comm.Barrier()
-
-    my_group_ids, i_my_groups = my_mpi_idx(N=len(tile_groups_files), size=size, rank=rank)
-    my_tile_groups = tile_groups_files[i_my_groups]
-    my_tile_groups_thalwegs = tile_groups2thalwegs[i_my_groups]
-    print(f'Rank {rank} handles Group {np.squeeze(np.argwhere(i_my_groups))}\n')
 
-    comm.Barrier()
+    # balance the workload based on the estimated cost of each group
+    partitions = None
+    if rank == 0:
+        # one stat per DEM tile, instead of one per (group, tile) pair
+        tile_sizes = [os.path.getsize(file) for file in file_table]
+        weights = group_weights(grouping['file_data'], grouping['file_offsets'], grouping['thalweg_offsets'], tile_sizes)
+        # Groups are ordered along a space-filling curve before being cut into balanced segments,
+        # so that consecutive groups on a rank tend to share DEM tiles (warm OS page cache)
+        order = morton_order(group_centers(grouping['file_data'], grouping['file_offsets'], grouping['tile_centers']))
+        partitions = sfc_partition(weights, order, size)
+
+    # each rank only receives its own groups
+    my_group_ids, my_file_csr, my_thalweg_csr = scatter_groups(grouping, partitions, comm)
+    my_tile_groups = csr2files(*my_file_csr, file_table=file_table)
+    my_tile_groups_thalwegs = csr2groups(*my_thalweg_csr)
+    print(f'Rank {rank} handles Group {my_group_ids}\n')
+
+    dem_cache_request.Wait()
     if rank == 0: print('\n---------------------------------beginning map generation---------------------------------\n')
-    comm.Barrier()
     time_all_groups_start = time.time()
 
+    group_outputs = []
+    my_output_dirs = []  # manifest of the per-group output folders written by this rank
+    log = []  # per-group messages are buffered and written once, to avoid flushing stdout through the MPI launcher for every group
     for i, (my_group_id, my_tile_group, my_tile_group_thalwegs) in enumerate(zip(my_group_ids, my_tile_groups, my_tile_groups_thalwegs)):
         time_this_group_start = time.time()
-        print(f'Rank {rank}: Group {i+1} (global: {my_group_id}) started ...')
+        log.append(f'Rank {rank}: Group {i+1} (global: {my_group_id}) started ...')
+        # each group writes to its own folder, so that no rank needs to scan the shared output_dir
+        group_output_dir = f'{output_dir}/Group_{my_group_id}_{rank}_{i}'
+        os.makedirs(group_output_dir, exist_ok=True)
+        my_output_dirs.append(group_output_dir)
         if True:  # my_group_id in range(0, 200):
-            make_river_map(
+            group_outputs.append(make_river_map(
                 tif_fnames = my_tile_group,
                 thalweg_shp_fname = thalweg_shp_fname,
                 selected_thalweg = my_tile_group_thalwegs,
-                output_dir = output_dir,
+                output_dir = group_output_dir,
                 output_prefix = f'Group_{my_group_id}_{rank}_{i}_',
                 mpi_print_prefix = f'[Rank {rank}, Group {i+1} of {len(my_tile_groups)}, global: {my_group_id}] ',
                 i_blast_intersection=i_blast_intersection,
                 i_OCSMesh=i_OCSMesh,
-            )
+            ))
         else:
             pass  # print(f'Rank {rank}: Group {my_group_id} failed')
 
-        print(f'Rank {rank}: Group {i+1} (global: {my_group_id}) run time: {time.time()-time_this_group_start} seconds.')
+        log.append(f'Rank {rank}: Group {i+1} (global: {my_group_id}) run time: {time.time()-time_this_group_start} seconds.')
 
-    print(f'Rank {rank}: total run time: {time.time()-time_all_groups_start} seconds.')
+    log.append(f'Rank {rank}: total run time: {time.time()-time_all_groups_start} seconds.')
+    sys.stdout.write('\n'.join(log) + '\n')
+    sys.stdout.flush()
 
-    comm.Barrier()
+    # send outputs to rank 0 in memory instead of through per-group files,
+    # gather also makes rank 0 wait until all ranks are done
+    outputs_from_ranks = comm.gather(collect_rank_outputs(group_outputs), root=0)
+    output_dirs_from_ranks = comm.gather(my_output_dirs, root=0)
 
     # finalize
     if rank == 0:
         # merge outputs from all ranks
-        total_arcs_map, total_intersection_joints, total_river_arcs, total_centerlines = merge_outputs(output_dir)
+        total_arcs_map, total_intersection_joints, total_river_arcs, total_centerlines, bomb_polygons = \
+            merge_outputs(output_dir, outputs_from_ranks)
 
         print(f'\n--------------- final clean-ups --------------------------------------------------------\n')
         time_final_cleanup_start = time.time()
 
-        total_arcs_cleaned = [arc for arc in total_arcs_map.to_GeoDataFrame().geometry.unary_union.geoms]
+        # arrays of shapely geometries are intersected by a single vectorized union
+        total_arcs = np.array(total_arcs_map.to_LineStringList(), dtype=object)
         if not i_blast_intersection:
-            bomb_polygons = gpd.read_file(f'{output_dir}/total_bomb_polygons.shp')
-            total_arcs_cleaned = clean_intersections(arcs=total_arcs_cleaned, target_polygons=bomb_polygons, snap_points=total_intersection_joints, i_OCSMesh=i_OCSMesh)
+            if bomb_polygons is not None:
+                bomb_polygons = np.asarray(bomb_polygons.geometry.values)
+            total_arcs_cleaned = clean_intersections(arcs=total_arcs, target_polygons=bomb_polygons, snap_points=total_intersection_joints, i_OCSMesh=i_OCSMesh)
+        else:
+            total_arcs_cleaned = [arc for arc in shapely.union_all(total_arcs).geoms]
         total_arcs_cleaned = clean_arcs(total_arcs_cleaned)
         SMS_MAP(arcs=geos2SmsArcList(total_arcs_cleaned)).writer(filename=f'{output_dir}/total_arcs.map')
 
-        gpd.GeoDataFrame(
+        pyogrio.write_dataframe(gpd.GeoDataFrame(
             index=range(len(total_arcs_cleaned)), crs='epsg:4326', geometry=total_arcs_cleaned
-        ).to_file(filename=f'{output_dir}/total_arcs.shp', driver="ESRI Shapefile")
+        ), f'{output_dir}/total_arcs.shp', driver="ESRI Shapefile")
 
         # outputs for OCSMesh
         if i_OCSMesh:
-            total_arcs_cleaned_polys = [poly for poly in polygonize(gpd.GeoSeries(total_arcs_cleaned))]
-            gpd.GeoDataFrame(
-                index=range(len(total_arcs_cleaned_polys)), crs='epsg:4326', geometry=total_arcs_cleaned_polys
-            ).to_file(filename=f'{output_dir}/total_polys_for_OCSMesh.shp', driver="ESRI Shapefile")
+            # a single GEOS call on the array of arcs, returning a GeometryCollection of polygons
+            total_arcs_cleaned_polys = np.array(shapely.polygonize(np.array(total_arcs_cleaned, dtype=object)).geoms)
+            pyogrio.write_dataframe(gpd.GeoDataFrame(
+                geometry=total_arcs_cleaned_polys, crs='epsg:4326'
+            ), f'{output_dir}/total_polys_for_OCSMesh.shp', driver="ESRI Shapefile")
 
         # river_arcs_cleaned = clean_river_arcs(total_river_arcs, total_arcs_cleaned)
         # total_river_outline_polys = generate_river_outline_polys(river_arcs_cleaned)
@@ -255,6 +564,6 @@ def river_map_mpi_driver(
 
         print(f'Final clean-ups took: {time.time()-time_final_cleanup_start} seconds.')
     
-        # delete per-core outputs
-        silentremove(glob(f'{output_dir}/Group*'))
+        # delete per-core outputs, which are listed in the manifests from all ranks
+        silentremove([x for output_dirs in output_dirs_from_ranks for x in output_dirs])
         print(f'>>>>>>>> Total run time: {time.time()-time_start} seconds >>>>>>>>')
@@ -7,11 +7,12 @@ import os
 import errno
 import copy
 import numpy as np
-import pickle
+import zipfile
 import json
 import time
 import math
 from dataclasses import dataclass
+from uuid import uuid4
 from osgeo import gdal
 from glob import glob
 from RiverMapper.SMS import lonlat2cpp, cpp2lonlat, get_all_points_from_shp
@@ -56,19 +57,47 @@ def get_tif_box(tif_fname=None):
     lry = uly + (src.RasterYSize * yres)
     return [ulx, lry, lrx, uly]
 
+def atomic_save(fname, save_func, *args, **kwargs):
+    '''
+    Save to a temporary file unique to this writer and rename it to {fname} (atomic),
+    so that concurrent writers of the same file (e.g., several ranks caching a shared tile)
+    never truncate each other's output, and readers never see a partially written file.
+    The temporary file is created with open() so that the cache follows the umask like any other output
+    (tempfile.mkstemp would make it owner-only, unreadable to other users of a shared DEM folder).
+    '''
+    tmp_name = f'{fname}.{os.getpid()}.{uuid4().hex}.tmp'
+    try:
+        with open(tmp_name, 'xb') as f:
+            save_func(f, *args, **kwargs)
+        os.replace(tmp_name, fname)
+    except BaseException:
+        silentremove(tmp_name)
+        raise
+
 def Tif2XYZ(tif_fname=None, cache=True):
+    '''
+    Read a tif file into a dem_data object.
+    The cache consists of two files next to the tif:
+    *.tif.npy for the elevation array, which is memory-mapped (copy-on-write) when read,
+    so that repeated reads of the same tile share the OS page cache instead of copying the array;
+    *.tif.npz for the coordinates.
+    '''
     is_new_cache = False
 
-    cache_name = tif_fname + '.pkl'
+    elev_cache_name = tif_fname + '.npy'
+    coord_cache_name = tif_fname + '.npz'
 
     if cache:
         try:
-            with open(cache_name, 'rb') as f:
-                S = pickle.load(f)
-                return [S, is_new_cache]  # cache successfully read
-        except (ModuleNotFoundError, AttributeError) as e:
+            with np.load(coord_cache_name) as coords:
+                xp, yp = coords['x'], coords['y']
+                dx, dy = float(coords['dx']), float(coords['dy'])
+            z = np.load(elev_cache_name, mmap_mode='c')
+            S = dem_data(xp, yp, xp, yp, z, dx, dy)
+            return [S, is_new_cache]  # cache successfully read
+        except (zipfile.BadZipFile, KeyError, ValueError, EOFError) as e:
             # remove existing cache if failing to read from it
-            silentremove(cache_name)
+            silentremove([coord_cache_name, elev_cache_name])
         except OSError as e:
             if e.errno != errno.ENOENT: # errno.ENOENT = no such file or directory
                 raise e
@@ -104,8 +133,9 @@ def Tif2XYZ(tif_fname=None, cache=True):
     S = dem_data(xp, yp, xp, yp, z, dx, dy)
 
     if cache:
-        with open(cache_name, 'wb') as f:
-            pickle.dump(S, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # the coordinates are written last, so that they only exist with a complete elevation cache
+        atomic_save(elev_cache_name, np.save, z)
+        atomic_save(coord_cache_name, np.savez, x=xp, y=yp, dx=dx, dy=dy)
         is_new_cache = True
 
     return [S, is_new_cache]  # already_cached = False
@@ -189,10 +219,11 @@ def find_thalweg_tile(
     thalweg_shp_fname='/sciclone/schism10/feiye/STOFS3D-v5/Inputs/v14/GA_riverstreams_cleaned_utm17N.shp',
     thalweg_buffer=1000,
     cache_folder=None,
-    iNoPrint=True, i_thalweg_cache=False
+    iNoPrint=True, i_thalweg_cache=False, i_return_boxes=False
 ):
     '''
-    Assign thalwegs to DEM tiles
+    Assign thalwegs to DEM tiles.
+    If i_return_boxes, a dict of DEM file name: box ([ulx, lry, lrx, uly]) is also returned.
     '''
     # read DEMs
     with open(dems_json_file) as d:
@@ -309,4 +340,8 @@ def find_thalweg_tile(
     # plt.hist(thalweg2large_group, bins=len(np.unique(thalweg2large_group)))
     # plt.show()
 
+    if i_return_boxes:
+        tile_boxes = {file: box for v in dem_dict.values() for file, box in zip(v['file_list'], v['boxes'])}
+        return thalweg2large_group, large_groups_files, np.array(large_group2thalwegs, dtype=object), tile_boxes
+
     return thalweg2large_group, large_groups_files, np.array(large_group2thalwegs, dtype=object)
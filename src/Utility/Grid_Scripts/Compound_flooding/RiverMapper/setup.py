@@ -27,5 +27,6 @@ with io.open('README.md','r', encoding='utf8') as fh:
     'gdal>=3.6.0',
     'shapely>=2.0.0',
     'geopandas>=0.12.0',
+    'pyogrio',
   ],
 )